@@ -1,9 +1,40 @@
 import base64
+import hashlib
 from dotenv import load_dotenv
 import os
 from typing import Optional, Dict, Any
 from google import genai
 import logging
+from api.cache import get_cache, make_key
+from api.profiler import phase
+
+# How long calorie estimates are shared between workers, in seconds. Meal
+# plans and recipes are not cached: regenerating must give a new plan
+CALORIES_TTL = 24 * 60 * 60
+
+# Layout of one recipe, shared by the meal plan and recipe prompts so that
+# parse_meal_plan reads both responses the same way
+RECIPE_FORMAT = """        Meal [Number]:
+        Recipe Name: [Recipe Name]
+        Ingredients: 
+        - [Ingredient 1]
+        - [Ingredient 2]
+        - [Ingredient 3]
+        - [Remaining Ingredients]
+        
+        Instructions:
+        1. Step 1
+        2. Step 2
+        3. Step 3
+        [Remaining Steps]
+        
+        Calories: [Total Calories]
+        Proteins: [Total Proteins]g
+        Fats: [Total Fats]g
+        Carbohydrates: [Total Carbohydrates]g
+
+        ---------------------------------------------
+"""
 
     
 class GeminiLLM:
@@ -22,10 +53,19 @@ class GeminiLLM:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
         
         self._client = genai.Client(api_key=api_key)
+        self._cache = get_cache()
         
-    def generate_completion(self, prompt: str, role: str = "recipe assistant") -> str:
+    def _generate(self, formatted_prompt: str) -> str:
         if not self._client:
             raise RuntimeError("Google AI client not initialized")
+
+        with phase("gemini"):
+            response = self._client.models.generate_content(
+                model="gemini-2.0-flash", contents=formatted_prompt
+            )
+        return response.text
+
+    def generate_completion(self, prompt: str, role: str = "recipe assistant") -> str:
         formatted_prompt = f"""
         "text": \"\"\"
         You are a [{role}]. You will create a week long meal plan based on the given prompt. DO NOT ADD ANY EXTRA INFORMATION. 
@@ -41,38 +81,39 @@ class GeminiLLM:
         Estimated Weekly Cost: [Estimated Weekly Cost]
     
         Day [Number]:
-        Meal [Number]:
-        Recipe Name: [Recipe Name]
-        Ingredients: 
-        - [Ingredient 1]
-        - [Ingredient 2]
-        - [Ingredient 3]
-        - [Remaining Ingredients]
-        
-        Instructions:
-        1. Step 1
-        2. Step 2
-        3. Step 3
-        [Remaining Steps]
-        
-        Calories: [Total Calories]
-        Proteins: [Total Proteins]g
-        Fats: [Total Fats]g
-        Carbohydrates: [Total Carbohydrates]g
+{RECIPE_FORMAT}
+        \"\"\"
+        """
+        return self._generate(formatted_prompt)
 
-        ---------------------------------------------
 
+    def generate_recipes(self, prompt: str, count: int, role: str = "meal planner") -> str:
+        formatted_prompt = f"""
+        "text": \"\"\"
+        You are a [{role}]. You will create exactly {count} different recipes that fit the given prompt. DO NOT ADD ANY EXTRA INFORMATION.
+
+        Follow the instructions carefully.
+
+        [{prompt}]
+
+        Format your response exactly like this, once for each recipe:
+
+{RECIPE_FORMAT}
         \"\"\"
         """
-        
-        response = self._client.models.generate_content(
-            model="gemini-2.0-flash", contents=formatted_prompt
-        )
-        return response.text
+        return self._generate(formatted_prompt)
 
 
     def calculate_calories(self, image_data: bytes) -> Dict[str, Any]:
         try:
+            cache_key = make_key("calories", hashlib.sha256(image_data).hexdigest())
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            with phase("base64"):
+                encoded_image = base64.b64encode(image_data).decode("utf-8")
+
             vision_content = {
                 "parts": [
                     {
@@ -102,19 +143,21 @@ class GeminiLLM:
                     {
                         "inline_data": {
                             "mime_type": "image/jpeg",
-                            "data": base64.b64encode(image_data).decode("utf-8")
+                            "data": encoded_image
                         }
                     }
                 ]
             }
 
             # Generate response
-            response = self._client.models.generate_content(
-                model="gemini-2.0-flash", contents=vision_content)
+            with phase("gemini"):
+                response = self._client.models.generate_content(
+                    model="gemini-2.0-flash", contents=vision_content)
                 
             if not response.text:
                 raise ValueError("No response generated from the model")
-                
+
+            self._cache.set(cache_key, response.text, ttl=CALORIES_TTL)
             return response.text
 
         except Exception as e:
@@ -124,13 +167,16 @@ class GeminiLLM:
 
     def generate_image(self, prompt: str) -> bytes:
         try:
-            response = self._client.models.generate_content(
-                model="gemini-2.0-flash-exp-image-generation",
-                contents=prompt,
-                config=genai.types.GenerateContentConfig(
-                    response_modalities=['Text', 'Image']
+            # Not cached here: callers store images under api.images.image_key,
+            # and caching by prompt as well would keep every image twice
+            with phase("gemini"):
+                response = self._client.models.generate_content(
+                    model="gemini-2.0-flash-exp-image-generation",
+                    contents=prompt,
+                    config=genai.types.GenerateContentConfig(
+                        response_modalities=['Text', 'Image']
+                    )
                 )
-            )
     
             for part in response.candidates[0].content.parts:
                 if part.inline_data is not None:
@@ -0,0 +1,324 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Any
+from dotenv import load_dotenv
+
+
+# Seconds a worker waits on another worker's write before giving up; a
+# cache that cannot be reached quickly is treated as a miss
+SQLITE_TIMEOUT = 5
+# Hits only refresh an entry's access time this often, so that reads do not
+# all queue up behind the single WAL writer
+ACCESS_UPDATE_INTERVAL = 60
+
+
+def make_key(namespace: str, *parts: Any) -> str:
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class CacheBackend(ABC):
+    """Key/value cache with per-entry TTLs and size-bounded eviction.
+
+    Values should be str, bytes or JSON data (lists come back from JSON in
+    place of tuples) so that every backend can store them. `shared` tells
+    callers whether a write or delete is seen by every worker.
+    """
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def contains(self, key: str) -> bool:
+        """Whether `key` holds an unexpired value, without loading it or counting a use."""
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class LRUCache(CacheBackend):
+    """In-process cache, evicting the least recently used entries when full.
+
+    The cache holds at most `max_entries` entries and, when `max_bytes` is
+    set, at most that many bytes of str and bytes values; other values are
+    kept by reference and only count towards the entry limit.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None) -> None:
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.time())
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        size = len(value) if isinstance(value, (str, bytes)) else 0
+        if self._max_bytes is not None and size > self._max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._total += size
+            while len(self._entries) > self._max_entries or (
+                self._max_bytes is not None and self._total > self._max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[2]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total = 0
+
+
+class SQLiteCache(CacheBackend):
+    """Cache shared by every worker on the host through a SQLite file in WAL mode.
+
+    Connections are opened lazily per process and thread, so the cache can be
+    created before gunicorn forks its workers. Only str, bytes and JSON values
+    are stored, so the file never holds anything that is executed when read.
+    Once the stored values exceed `max_bytes`, expired entries are dropped
+    first and then the least recently used ones. The running total is kept
+    in a one-row table by triggers, so checking it does not scan the values.
+    Errors from SQLite (a locked database, a full disk) are logged and
+    treated as a miss.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024,
+                 access_update_interval: float = ACCESS_UPDATE_INTERVAL) -> None:
+        self._path = path
+        self._max_bytes = max_bytes
+        self._access_update_interval = access_update_interval
+        self._local = threading.local()
+        conn = self._connection()
+        # The value goes last so that reading the other columns of a row never
+        # has to walk through a large value's overflow pages
+        conn.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL,
+                value BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cache_entries_accessed_at ON cache_entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_size (id, total)
+                SELECT 0, COALESCE(SUM(size), 0) FROM cache_entries;
+            CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN
+                UPDATE cache_size SET total = total + NEW.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS cache_entries_update AFTER UPDATE OF size ON cache_entries BEGIN
+                UPDATE cache_size SET total = total + NEW.size - OLD.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN
+                UPDATE cache_size SET total = total - OLD.size WHERE id = 0;
+            END;
+            DROP TABLE IF EXISTS cache;
+            COMMIT;
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _execute(self, query: str, values: tuple = ()) -> list:
+        return self._connection().execute(query, values).fetchall()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        try:
+            rows = self._execute(
+                "SELECT kind, value, accessed_at FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"Cache read failed for {key}: {str(e)}")
+            return default
+        if not rows:
+            return default
+
+        kind, data, accessed_at = rows[0]
+        if now - accessed_at >= self._access_update_interval:
+            try:
+                self._execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+            except sqlite3.Error:
+                # Only affects eviction order, so losing the update is fine
+                pass
+
+        if kind == "bytes":
+            return bytes(data)
+        if kind == "str":
+            return bytes(data).decode("utf-8")
+        return json.loads(data)
+
+    def contains(self, key: str) -> bool:
+        try:
+            rows = self._execute(
+                "SELECT 1 FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"Cache read failed for {key}: {str(e)}")
+            return False
+        return bool(rows)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        if isinstance(value, bytes):
+            kind, data = "bytes", value
+        elif isinstance(value, str):
+            kind, data = "str", value.encode("utf-8")
+        else:
+            # Raises TypeError for anything that is not plain JSON data
+            kind, data = "json", json.dumps(value).encode("utf-8")
+        if len(data) > self._max_bytes:
+            return
+        try:
+            # An upsert rather than INSERT OR REPLACE, as the implicit delete of
+            # a replace does not fire the trigger that keeps the total
+            self._execute(
+                """
+                INSERT INTO cache_entries (key, kind, size, expires_at, accessed_at, value)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    kind = excluded.kind, size = excluded.size, expires_at = excluded.expires_at,
+                    accessed_at = excluded.accessed_at, value = excluded.value
+                """,
+                (key, kind, len(data), now + ttl if ttl else None, now, data),
+            )
+            self._evict(now)
+        except sqlite3.Error as e:
+            logging.warning(f"Cache write failed for {key}: {str(e)}")
+
+    def _evict(self, now: float) -> None:
+        if self._total() <= self._max_bytes:
+            return
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            total = self._total()
+            for key, size in conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at").fetchall():
+                if total <= self._max_bytes:
+                    break
+                conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                total -= size
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _total(self) -> int:
+        return self._execute("SELECT total FROM cache_size WHERE id = 0")[0][0]
+
+    def delete(self, key: str) -> None:
+        try:
+            self._execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logging.warning(f"Cache delete failed for {key}: {str(e)}")
+
+    def clear(self) -> None:
+        try:
+            self._execute("DELETE FROM cache_entries")
+        except sqlite3.Error as e:
+            logging.warning(f"Cache clear failed: {str(e)}")
+
+
+def _private_cache_dir() -> str:
+    """Per-user cache directory under the temp dir that only this user can access."""
+    uid = os.getuid() if hasattr(os, "getuid") else None
+    path = os.path.join(tempfile.gettempdir(), f"mealmate-cache-{uid if uid is not None else 'default'}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    # The directory may have been created by someone else before we got here
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or (uid is not None and info.st_uid != uid) or info.st_mode & 0o077:
+        raise PermissionError(f"Cache directory {path} is not private to this user")
+    return path
+
+
+_shared_cache: Optional[CacheBackend] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_cache() -> CacheBackend:
+    """Return the process wide cache selected by CACHE_BACKEND ("sqlite" or "memory")."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            load_dotenv()
+            backend = os.getenv("CACHE_BACKEND", "sqlite").lower()
+            max_bytes = int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+            if backend == "sqlite":
+                try:
+                    path = os.getenv("CACHE_PATH") or os.path.join(_private_cache_dir(), "cache.sqlite3")
+                    _shared_cache = SQLiteCache(path, max_bytes)
+                except (sqlite3.Error, OSError) as error:
+                    print(f"Error opening shared cache, falling back to in-process cache: {error}")
+            if _shared_cache is None:
+                _shared_cache = LRUCache(int(os.getenv("CACHE_MAX_ENTRIES", 1024)), max_bytes)
+        return _shared_cache
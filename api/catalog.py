@@ -0,0 +1,263 @@
+import itertools
+import random
+import threading
+from collections import OrderedDict, defaultdict, deque
+from typing import Optional, Dict, List, Set, Any
+from api.parser import parse_meal_plan
+from api.search import tokenize
+from api.cache import LRUCache
+
+DAYS_PER_PLAN = 7
+DEFAULT_MEALS_PER_DAY = 3
+# Upper bound on catalog size; the oldest recipes are evicted first
+MAX_RECIPES = 5000
+# A catalog recipe fits a slot if its calories are within this fraction of
+# the requested calories per meal
+CALORIE_TOLERANCE = 0.15
+# Below this share of filled slots a full generate_completion call is cheaper
+# and more coherent than generating the missing recipes one by one
+MIN_FILL_RATIO = 0.5
+# Profile fields that must match exactly for a recipe to be reused
+EXACT_FIELDS = ("cooking_skill", "cooking_time", "dietary_goals")
+# Recipes from a user's last few plans are not reused for that user
+RECENT_PLANS = 3
+MAX_TRACKED_USERS = 10000
+
+
+def _split(value: Optional[str]) -> Set[str]:
+    return {part.strip().lower() for part in (value or "").split(",") if part.strip()}
+
+
+def _normalize(value: Optional[str]) -> str:
+    return ", ".join(sorted(_split(value)))
+
+
+def _recipe_body(text: str) -> str:
+    # Drop the "Meal N:" header and separator lines so the recipe can be renumbered
+    lines = text.strip().splitlines()[1:]
+    return "\n".join(line for line in lines if not line.strip() or line.strip("-*_ ")).strip()
+
+
+class Recipe:
+    def __init__(self, recipe_id: int, meal: Dict[str, Any], slot: int, meals_per_day: int, request) -> None:
+        self.id = recipe_id
+        self.name = meal["recipe_name"]
+        self.body = _recipe_body(meal["text"])
+        self.calories = meal["calories"]
+        self.ingredient_terms = set(tokenize(" ".join(meal["ingredients"])))
+        self.slot = slot
+        self.meals_per_day = meals_per_day
+        self.cuisines = _split(request.cuisine)
+        self.meal_types = _split(request.meal_type)
+        self.restrictions = _split(request.dietary_restriction)
+        self.profile = {field: _normalize(getattr(request, field)) for field in EXACT_FIELDS}
+        self.key = (
+            self.name.lower(), slot, meals_per_day,
+            frozenset(self.cuisines), frozenset(self.meal_types), frozenset(self.restrictions),
+            tuple(self.profile.values()),
+        )
+
+
+class RecipeCatalog:
+    """Recipes harvested from generated meal plans, reused to assemble new plans.
+
+    Recipes are indexed by cuisine, dietary restriction, calorie band, cooking
+    time and ingredients. `assemble_meal_plan` fills a requested week from
+    matching recipes and only asks Gemini for the slots it cannot fill.
+    Recipes are picked at random among the matches, skipping those in the
+    requesting user's recent plans, so regenerating gives a different week.
+    """
+    _instance: Optional['RecipeCatalog'] = None
+
+    def __new__(cls) -> 'RecipeCatalog':
+        if cls._instance is None:
+            cls._instance = super(RecipeCatalog, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self._recipes: 'OrderedDict[int, Recipe]' = OrderedDict()
+        self._keys: Dict[tuple, int] = {}
+        self._by_cuisine: Dict[str, Set[int]] = defaultdict(set)
+        self._by_restriction: Dict[str, Set[int]] = defaultdict(set)
+        self._by_cooking_time: Dict[str, Set[int]] = defaultdict(set)
+        self._by_calorie_band: Dict[int, Set[int]] = defaultdict(set)
+        self._by_ingredient: Dict[str, Set[int]] = defaultdict(set)
+        self._ids = itertools.count(1)
+        # user id -> recipe names of their last RECENT_PLANS plans
+        self._recent = LRUCache(max_entries=MAX_TRACKED_USERS)
+        self._lock = threading.Lock()
+
+    def _indexes(self, recipe: Recipe):
+        for cuisine in recipe.cuisines:
+            yield self._by_cuisine, cuisine
+        for restriction in recipe.restrictions:
+            yield self._by_restriction, restriction
+        yield self._by_cooking_time, recipe.profile["cooking_time"]
+        if recipe.calories is not None:
+            yield self._by_calorie_band, int(recipe.calories // 100)
+        for term in recipe.ingredient_terms:
+            yield self._by_ingredient, term
+
+    def _add(self, meal: Dict[str, Any], slot: int, meals_per_day: int, request) -> None:
+        if not meal["recipe_name"] or meal["calories"] is None:
+            return
+        recipe = Recipe(next(self._ids), meal, slot, meals_per_day, request)
+        if recipe.key in self._keys:
+            return
+
+        self._recipes[recipe.id] = recipe
+        self._keys[recipe.key] = recipe.id
+        for index, value in self._indexes(recipe):
+            index[value].add(recipe.id)
+
+        while len(self._recipes) > MAX_RECIPES:
+            _, evicted = self._recipes.popitem(last=False)
+            del self._keys[evicted.key]
+            for index, value in self._indexes(evicted):
+                index[value].discard(evicted.id)
+                if not index[value]:
+                    del index[value]
+
+    def _remember(self, user_id: str, names: List[str]) -> None:
+        plans = self._recent.get(str(user_id))
+        if plans is None:
+            plans = deque(maxlen=RECENT_PLANS)
+            self._recent.set(str(user_id), plans)
+        plans.append({name.lower() for name in names if name})
+
+    def _recent_names(self, user_id: str) -> Set[str]:
+        return set().union(*(self._recent.get(str(user_id)) or []))
+
+    def add_meal_plan(self, request, mealplan: str) -> None:
+        """Add every recipe of a generated plan, tagged with the request that produced it."""
+        days = parse_meal_plan(mealplan)
+        with self._lock:
+            for day in days:
+                meals_per_day = request.meals_per_day or len(day["meals"])
+                for slot, meal in enumerate(day["meals"], start=1):
+                    self._add(meal, slot, meals_per_day, request)
+            self._remember(request.id, [meal["recipe_name"] for day in days for meal in day["meals"]])
+
+    def _candidates(self, request, slot: int, meals_per_day: int) -> List[Recipe]:
+        # Narrow down with the indexes first, then check the remaining constraints
+        candidate_sets = []
+        cuisines = _split(request.cuisine)
+        if cuisines:
+            candidate_sets.append(set().union(*(self._by_cuisine.get(c, set()) for c in cuisines)))
+        for restriction in _split(request.dietary_restriction):
+            candidate_sets.append(self._by_restriction.get(restriction, set()))
+        cooking_time = _normalize(request.cooking_time)
+        if cooking_time:
+            candidate_sets.append(self._by_cooking_time.get(cooking_time, set()))
+        if request.calories:
+            target = request.calories / meals_per_day
+            low = int(target * (1 - CALORIE_TOLERANCE) // 100)
+            high = int(target * (1 + CALORIE_TOLERANCE) // 100)
+            candidate_sets.append(set().union(*(self._by_calorie_band.get(b, set()) for b in range(low, high + 1))))
+        disliked = set(tokenize(request.disliked_ingredients))
+        excluded = set().union(*(self._by_ingredient.get(term, set()) for term in disliked))
+
+        if candidate_sets:
+            ids = set.intersection(*(set(c) for c in candidate_sets))
+        else:
+            ids = set(self._recipes)
+        ids -= excluded
+
+        meal_types = _split(request.meal_type)
+        profile = {field: _normalize(getattr(request, field)) for field in EXACT_FIELDS}
+        # Each requested ingredient is a phrase (e.g. "brown rice") whose words
+        # must all appear in the recipe's ingredients
+        wanted = [
+            set(tokenize(ingredient))
+            for ingredient in _split(request.ingredients) | _split(request.available_ingredients)
+        ]
+        wanted = [terms for terms in wanted if terms]
+        matches = []
+        for recipe_id in ids:
+            recipe = self._recipes[recipe_id]
+            if recipe.slot != slot or recipe.meals_per_day != meals_per_day:
+                continue
+            if meal_types and not meal_types & recipe.meal_types:
+                continue
+            if any(value and recipe.profile[field] != value for field, value in profile.items()):
+                continue
+            if request.calories and abs(recipe.calories - target) > target * CALORIE_TOLERANCE:
+                continue
+            # The full plan prompt asks Gemini to use these ingredients, so a
+            # reused recipe must contain at least one of them
+            if wanted and not any(terms <= recipe.ingredient_terms for terms in wanted):
+                continue
+            matches.append(recipe)
+
+        # Prefer recipes that use more of the requested or available ingredients,
+        # in random order among equally good ones (the sort is stable)
+        random.shuffle(matches)
+        matches.sort(key=lambda recipe: -sum(terms <= recipe.ingredient_terms for terms in wanted))
+        return matches
+
+    def _fill(self, request, meals_per_day: int) -> List[List[Optional[Recipe]]]:
+        week = []
+        with self._lock:
+            used = self._recent_names(request.id)
+            candidates = {
+                slot: self._candidates(request, slot, meals_per_day)
+                for slot in range(1, meals_per_day + 1)
+            }
+        for _ in range(DAYS_PER_PLAN):
+            day = []
+            for slot in range(1, meals_per_day + 1):
+                # Never repeat a recipe within the same week or from recent plans
+                recipe = next((r for r in candidates[slot] if r.name.lower() not in used), None)
+                if recipe is not None:
+                    used.add(recipe.name.lower())
+                day.append(recipe)
+            week.append(day)
+        return week
+
+    def assemble_meal_plan(self, request, prompt: str, ai_model) -> Optional[str]:
+        """Build a week long plan from catalog recipes, generating only the gaps.
+
+        Returns None when the catalog cannot fill enough of the week, in which
+        case the caller should generate the whole plan as usual.
+        """
+        if request.budget_constraints:
+            # Catalog recipes carry no cost estimate, so a budget cannot be checked
+            return None
+
+        meals_per_day = request.meals_per_day or DEFAULT_MEALS_PER_DAY
+        week = self._fill(request, meals_per_day)
+        missing = [(d, s) for d, day in enumerate(week) for s, recipe in enumerate(day) if recipe is None]
+        total = DAYS_PER_PLAN * meals_per_day
+        if total - len(missing) < total * MIN_FILL_RATIO:
+            return None
+
+        generated: List[Dict[str, Any]] = []
+        if missing:
+            used = [recipe.name for day in week for recipe in day if recipe is not None]
+            slots = ", ".join(f"meal {s + 1} of {meals_per_day} on day {d + 1}" for d, s in missing)
+            recipe_prompt = f"{prompt}. The recipes are for: {slots}. Do not reuse these recipes: {', '.join(used)}"
+            response = ai_model.generate_recipes(recipe_prompt, len(missing))
+            generated = [meal for day in parse_meal_plan("Day 1:\n" + response) for meal in day["meals"]]
+            if len(generated) < len(missing):
+                return None
+
+        lines = [f"Meal Plan {request.calories} Calories Per Day" if request.calories else "Meal Plan", ""]
+        lines += ["Estimated Weekly Cost: N/A", ""]
+        fresh = iter(generated)
+        for d, day in enumerate(week):
+            lines.append(f"Day {d + 1}:")
+            for s, recipe in enumerate(day):
+                if recipe is not None:
+                    body = recipe.body
+                else:
+                    meal = next(fresh)
+                    body = _recipe_body(meal["text"])
+                    with self._lock:
+                        self._add(meal, s + 1, meals_per_day, request)
+                lines += [f"Meal {s + 1}:", body, "", "-" * 45, ""]
+
+        names = [recipe.name for day in week for recipe in day if recipe is not None]
+        with self._lock:
+            self._remember(request.id, names + [meal["recipe_name"] for meal in generated])
+        return "\n".join(lines).strip() + "\n"
@@ -2,6 +2,7 @@ import mysql.connector
 from mysql.connector import Error
 import os
 from dotenv import load_dotenv
+from api.profiler import phase
 
 class DatabaseConnection:
     _instance = None
@@ -29,6 +30,10 @@ class DatabaseConnection:
             raise error
 
     def execute_query(self, query, values=None):
+        with phase("db"):
+            return self._execute_query(query, values)
+
+    def _execute_query(self, query, values=None):
         try:
             # Reconnect if connection is lost
             if not self.conn.is_connected():
@@ -53,4 +58,8 @@ class DatabaseConnection:
 
         except Error as e:
             print(f"Error executing query: {e}")
-            raise e
\ No newline at end of file
+            raise e
+
+    def get_last_insert_id(self):
+        # id generated by the most recent INSERT on this connection
+        return self.cursor.lastrowid
@@ -0,0 +1,202 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, List
+from dotenv import load_dotenv
+from api.cache import get_cache, make_key
+from api.parser import parse_meal_plan
+
+# How long generated day images are kept in the shared cache, in seconds
+IMAGE_TTL = 7 * 24 * 60 * 60
+
+
+def meal_names(recipe: str) -> List[str]:
+    meals = recipe.split("Meal ")[1:]  # Split by "Meal " and remove empty first element
+    names = []
+    for meal in meals:
+        recipe_name = meal.split("Recipe Name: ")[1].split("\n")[0].strip() if "Recipe Name: " in meal else ""
+        if recipe_name:
+            names.append(recipe_name)
+    return names
+
+
+def build_image_prompt(recipe: str) -> str:
+    meals = recipe.split("Meal ")[1:]
+
+    if len(meals) > 1:
+        # Extract recipe names for both meals
+        names = meal_names(recipe)
+        return (
+            f"Generate a photorealistic image with these {len(names)} meals MUST BE ARRANGED VERTICALLY: {', '.join(names)}. "
+            f"Each meal should be plated on its own separate white plate. "
+            f"Arrange the plates vertically, one below the other, with clear borders or space separating each meal. "
+            f"Display meals in the order they appear in the recipe, from top to bottom. "
+            f"Use natural lighting and clear details. "
+            f"Present in a professional food photography style without text or labels. "
+            f"Each dish should look appetizing, properly garnished, and well-presented. "
+            f"Use a neutral light background to make each meal stand out. "
+            f"Make sure there's clear visual separation between meals with subtle shadows or spacing."
+        )
+
+    # Single meal
+    return (
+        f"Generate a photorealistic image of this exact meal: {recipe}. "
+        f"Show ONLY ONE plate with this specific dish, photographed from above or at "
+        f"a 45-degree angle if the food is inside a glass. "
+        f"Use natural lighting and clear details on a white plate. "
+        f"Present it in a professional food photography style without any text or labels. "
+        f"Do not include multiple plates or other meals. "
+        f"Try not to make the food look plain, dry, or unappetizing."
+    )
+
+
+def image_key(recipe: str) -> str:
+    """Cache key for a day's image.
+
+    Keyed by recipe names rather than the full text so an image pre-generated
+    from the stored plan is found for the text the client sends for that day.
+    """
+    names = meal_names(recipe)
+    if names:
+        return make_key("meal-image", *names)
+    return make_key("meal-image-prompt", build_image_prompt(recipe))
+
+
+class _Job:
+    def __init__(self, key: str, recipe: str) -> None:
+        self.key = key
+        self.recipe = recipe
+        self.created_at = time.monotonic()
+        self.cancelled = False
+        self.done = threading.Event()
+
+
+class ImagePrefetcher:
+    """Generates each day's image in the background after a plan is saved.
+
+    Jobs run one at a time on a daemon thread. The thread waits while more
+    than IMAGE_PREFETCH_MAX_FOREGROUND requests are in flight, drops jobs that
+    waited longer than IMAGE_PREFETCH_MAX_AGE seconds, and skips jobs that a
+    foreground request has already claimed. Generated images go to the shared
+    cache under `image_key`.
+    """
+    _instance: Optional['ImagePrefetcher'] = None
+
+    def __new__(cls) -> 'ImagePrefetcher':
+        if cls._instance is None:
+            cls._instance = super(ImagePrefetcher, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        load_dotenv()
+        self.max_foreground = int(os.getenv("IMAGE_PREFETCH_MAX_FOREGROUND", 4))
+        self.max_age = float(os.getenv("IMAGE_PREFETCH_MAX_AGE", 10 * 60))
+        self.max_queued = int(os.getenv("IMAGE_PREFETCH_MAX_QUEUED", 100))
+        self.poll_interval = 0.5
+
+        self._cache = get_cache()
+        self._queue: 'queue.PriorityQueue' = queue.PriorityQueue()
+        self._jobs: Dict[str, _Job] = {}
+        self._running: Optional[_Job] = None
+        self._foreground = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def foreground(self):
+        """Mark a foreground request as in flight for the duration of the block."""
+        with self._lock:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+
+    def schedule(self, mealplan: str, ai_model) -> int:
+        """Queue image generation for every day of a plan, returning the number of jobs queued."""
+        scheduled = 0
+        for day in parse_meal_plan(mealplan):
+            recipe = "".join(meal["text"] for meal in day["meals"])
+            if not recipe:
+                continue
+            key = image_key(recipe)
+            if self._cache.contains(key):
+                continue
+            with self._lock:
+                if key in self._jobs or len(self._jobs) >= self.max_queued:
+                    continue
+                job = _Job(key, recipe)
+                self._jobs[key] = job
+                # Earlier days are generated first since they are opened first
+                self._queue.put((day["day"], next(self._sequence), job, ai_model))
+                scheduled += 1
+
+        if scheduled:
+            self._start()
+        return scheduled
+
+    def claim(self, key: str) -> Optional[threading.Event]:
+        """Called by the image endpoint before generating an image itself.
+
+        A queued job for the same image is cancelled, since the foreground
+        request is about to do the work. If the job is already running, its
+        completion event is returned so the caller can wait for it instead.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return None
+            if job is self._running:
+                return job.done
+            job.cancelled = True
+            del self._jobs[key]
+            return None
+
+    def _start(self) -> None:
+        with self._lock:
+            # Threads do not survive a fork, so check liveness rather than existence
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="image-prefetch", daemon=True)
+                self._thread.start()
+
+    def _expired(self, job: _Job) -> bool:
+        return time.monotonic() - job.created_at > self.max_age
+
+    def _forget(self, job: _Job) -> None:
+        # The key may have been claimed and scheduled again by a newer job
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+
+    def _run(self) -> None:
+        while True:
+            _, _, job, ai_model = self._queue.get()
+
+            # Back off while foreground traffic is high
+            while self._foreground > self.max_foreground and not job.cancelled and not self._expired(job):
+                time.sleep(self.poll_interval)
+
+            with self._lock:
+                if job.cancelled or self._expired(job):
+                    self._forget(job)
+                    job.done.set()
+                    continue
+                self._running = job
+
+            try:
+                image_data = ai_model.generate_image(build_image_prompt(job.recipe))
+                if image_data:
+                    self._cache.set(job.key, image_data, ttl=IMAGE_TTL)
+            except Exception as e:
+                logging.error(f"Error pre-generating meal image: {str(e)}")
+            finally:
+                with self._lock:
+                    self._running = None
+                    self._forget(job)
+                job.done.set()
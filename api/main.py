@@ -1,17 +1,38 @@
+import asyncio
 import base64
-from fastapi import FastAPI, HTTPException, status, File, UploadFile
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Header, Request, status, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
 from api.database import DatabaseConnection
 import bcrypt
-from api.models import UserData, LoginData, MealPlanRequest, ChangeData, MealPlanRetrieve, IndividualMealPlanRetrieve
+from api.models import UserData, LoginData, MealPlanRequest, ChangeData, MealPlanRetrieve, IndividualMealPlanRetrieve, MealPlanSearch, NutritionAnalyticsRequest, ProfilerConfig
 from api.LLM import GeminiLLM
+from api.search import MealPlanSearchIndex
+from api.nutrition import NutritionAnalytics
+from api.catalog import RecipeCatalog
+from api.cache import get_cache, make_key
+from api.images import ImagePrefetcher, build_image_prompt, image_key, IMAGE_TTL
+from api.profiler import Profiler, JSONResponse, phase, PROFILE_COLLECT_DELAY
 import logging
 from datetime import datetime
 
 app = FastAPI()
 db = DatabaseConnection()
 ai_model = GeminiLLM()
+search_index = MealPlanSearchIndex()
+nutrition_analytics = NutritionAnalytics()
+recipe_catalog = RecipeCatalog()
+cache = get_cache()
+image_prefetcher = ImagePrefetcher()
+profiler = Profiler()
+
+# How long query results are shared between workers, in seconds
+QUERY_TTL = 10 * 60
+# How long the image endpoint waits for a pre-generation that is already running
+PREFETCH_WAIT = 60
+# Upper bound on an on-demand profile, in seconds
+MAX_PROFILE_SECONDS = 60
 
 # Add CORS middleware
 app.add_middleware(
@@ -25,6 +46,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Track foreground load so background image pre-generation can back off, and
+# time requests for the profiler when it is enabled
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    tracked = profiler.begin_request(request.method, request.url.path)
+    try:
+        with image_prefetcher.foreground():
+            return await call_next(request)
+    finally:
+        if tracked is not None:
+            profiler.end_request(tracked)
+
 # About page route
 @app.get("/about")
 def about() -> dict[str, str]:
@@ -34,7 +67,8 @@ def about() -> dict[str, str]:
 async def register_user(user_data: UserData) -> JSONResponse:
     try:
         # Hash the password
-        hashed_password = bcrypt.hashpw(user_data.password.encode("utf-8"), bcrypt.gensalt())
+        with phase("bcrypt"):
+            hashed_password = bcrypt.hashpw(user_data.password.encode("utf-8"), bcrypt.gensalt())
         
         # Check for existing user
         query = """
@@ -135,7 +169,9 @@ async def login_user(user_data: LoginData) -> JSONResponse:
             user = rows[0]  # First row from results
             stored_password = user[3]  # Password is at index 3
             
-            if bcrypt.checkpw(user_data.password.encode("utf-8"), stored_password.encode("utf-8")):
+            with phase("bcrypt"):
+                password_matches = bcrypt.checkpw(user_data.password.encode("utf-8"), stored_password.encode("utf-8"))
+            if password_matches:
                 return JSONResponse(
                     status_code=status.HTTP_200_OK,
                     content={
@@ -238,7 +274,9 @@ async def update_password(change_data: ChangeData) -> JSONResponse:
         user_id, hashed_password = result[0]
 
         # Validate current password
-        if not bcrypt.checkpw(change_data.originalPassword.encode(), hashed_password.encode()):
+        with phase("bcrypt"):
+            password_matches = bcrypt.checkpw(change_data.originalPassword.encode(), hashed_password.encode())
+        if not password_matches:
             return JSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST, 
                 content={"status": status.HTTP_400_BAD_REQUEST,
@@ -252,7 +290,8 @@ async def update_password(change_data: ChangeData) -> JSONResponse:
                                         "message": "New password must be different from the old password."})
 
         # Hash and update new password
-        new_hashed_password = bcrypt.hashpw(change_data.newPassword.encode(), bcrypt.gensalt()).decode()
+        with phase("bcrypt"):
+            new_hashed_password = bcrypt.hashpw(change_data.newPassword.encode(), bcrypt.gensalt()).decode()
         query = "UPDATE users SET password = %s WHERE id = %s"
         db.execute_query(query, (new_hashed_password, user_id))
 
@@ -292,8 +331,17 @@ async def generate_meal_plan(request: MealPlanRequest) -> JSONResponse:
         if request.budget_constraints:
             prompt += f" with budget constraint of ${request.budget_constraints}"
 
-
-        response = ai_model.generate_completion(prompt, role="meal planner")
+        # Reuse catalog recipes when possible and only generate the missing ones
+        response = None
+        if request.use_catalog:
+            try:
+                response = recipe_catalog.assemble_meal_plan(request, prompt, ai_model)
+            except Exception as catalog_error:
+                print(f"Recipe catalog error: {str(catalog_error)}")
+
+        if response is None:
+            response = ai_model.generate_completion(prompt, role="meal planner")
+            recipe_catalog.add_meal_plan(request, response)
         
         timestamp = datetime.now().strftime("%B %d, %Y")
         title_parts = []
@@ -319,14 +367,8 @@ async def generate_meal_plan(request: MealPlanRequest) -> JSONResponse:
         # Execute the query
         try:
             db.execute_query(query, values)
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content={
-                    "status": status.HTTP_200_OK,
-                    "message": "Meal plan generated and succesfully saved into database",
-                    "response": response
-                }
-            )
+            plan_id = db.get_last_insert_id()
+            cache.delete(make_key("mealplans", request.id))
         except Exception as db_error:
             print(f"Mealplan Database error: {str(db_error)}")
             return JSONResponse(
@@ -336,6 +378,26 @@ async def generate_meal_plan(request: MealPlanRequest) -> JSONResponse:
                     "message": "Meal plan generated successfully, but an error occurred while saving it to the database."
                 }
             )
+
+        # The plan is saved at this point, so a failure here must not fail the request
+        try:
+            search_index.add_mealplan(request.id, plan_id, title, response)
+        except Exception as index_error:
+            print(f"Search index error: {str(index_error)}")
+        if request.pregenerate_images:
+            try:
+                image_prefetcher.schedule(response, ai_model)
+            except Exception as prefetch_error:
+                print(f"Image pre-generation error: {str(prefetch_error)}")
+
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "status": status.HTTP_200_OK,
+                "message": "Meal plan generated and succesfully saved into database",
+                "response": response
+            }
+        )
     except Exception as e:
         print(f"Error generating meal plan: {str(e)}")
         return JSONResponse(
@@ -356,7 +418,14 @@ async def retrieve_user_mealplan(request: MealPlanRetrieve) -> JSONResponse:
         """
         values = (request.id,) 
 
-        response = db.execute_query(query, values)
+        # The list changes on insert, so it is only cached when the
+        # invalidation in generate_meal_plan reaches every worker
+        cache_key = make_key("mealplans", request.id)
+        response = cache.get(cache_key) if cache.shared else None
+        if response is None:
+            response = [tuple(row) for row in db.execute_query(query, values)]
+            if cache.shared:
+                cache.set(cache_key, response, ttl=QUERY_TTL)
 
         if len(response) == 0:
             return JSONResponse(
@@ -405,7 +474,13 @@ async def retrieve_mealplan(request: IndividualMealPlanRetrieve) -> JSONResponse
         """
         values = (request.meal_id, request.id) 
 
-        response = db.execute_query(query, values)
+        # Saved meal plans never change, so they can be shared between workers
+        cache_key = make_key("mealplan", request.meal_id, request.id)
+        response = cache.get(cache_key)
+        if response is None:
+            response = [tuple(row) for row in db.execute_query(query, values)]
+            if response:
+                cache.set(cache_key, response, ttl=QUERY_TTL)
 
         if len(response) == 0:
             return JSONResponse(
@@ -436,47 +511,85 @@ async def retrieve_mealplan(request: IndividualMealPlanRetrieve) -> JSONResponse
             }
         )
     
+@app.post("/search-mealplans")
+async def search_mealplans(request: MealPlanSearch) -> JSONResponse:
+    if request.page < 1 or request.page_size < 1 or request.page_size > 100:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "status": status.HTTP_400_BAD_REQUEST,
+                "message": "page must be at least 1 and page_size between 1 and 100"
+            }
+        )
+
+    try:
+        results = search_index.search(db, request.id, request.query, request.page, request.page_size)
+
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "status": status.HTTP_200_OK,
+                "message": "Meal plans searched successfully",
+                **results
+            }
+        )
+    except Exception as e:
+        print(f"Error searching meal plans: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={
+                "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "message": "Error searching meal plans",
+                "results": []
+            }
+        )
+
+@app.post("/nutrition-analytics")
+async def get_nutrition_analytics(request: NutritionAnalyticsRequest) -> JSONResponse:
+    try:
+        analytics = nutrition_analytics.summarize(db, request.id, request.calories)
+
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "status": status.HTTP_200_OK,
+                "message": "Nutrition analytics calculated successfully",
+                **analytics
+            }
+        )
+    except Exception as e:
+        print(f"Error calculating nutrition analytics: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={
+                "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "message": "Error calculating nutrition analytics"
+            }
+        )
+
 
 @app.post("/generate-meal-image/{day}")
 async def generate_meal_image(day: int, recipe_data: dict) -> JSONResponse:
     try:
         recipe = recipe_data.get('recipe', '')
-        meals = recipe.split("Meal ")[1:]  # Split by "Meal " and remove empty first element
-
-        if len(meals) > 1:
-            # Extract recipe names for both meals
-            meal_names = []
-            for meal in meals:
-                recipe_name = meal.split("Recipe Name: ")[1].split("\n")[0].strip() if "Recipe Name: " in meal else ""
-                if recipe_name:
-                    meal_names.append(recipe_name)
-
-            image_prompt = (
-                f"Generate a photorealistic image with these {len(meal_names)} meals MUST BE ARRANGED VERTICALLY: {', '.join(meal_names)}. "
-                f"Each meal should be plated on its own separate white plate. "
-                f"Arrange the plates vertically, one below the other, with clear borders or space separating each meal. "
-                f"Display meals in the order they appear in the recipe, from top to bottom. "
-                f"Use natural lighting and clear details. "
-                f"Present in a professional food photography style without text or labels. "
-                f"Each dish should look appetizing, properly garnished, and well-presented. "
-                f"Use a neutral light background to make each meal stand out. "
-                f"Make sure there's clear visual separation between meals with subtle shadows or spacing."
-            );
-            
-        else:
-            # Single meal
-            image_prompt = (
-                f"Generate a photorealistic image of this exact meal: {recipe}. "
-                f"Show ONLY ONE plate with this specific dish, photographed from above or at "
-                f"a 45-degree angle if the food is inside a glass. "
-                f"Use natural lighting and clear details on a white plate. "
-                f"Present it in a professional food photography style without any text or labels. "
-                f"Do not include multiple plates or other meals. "
-                f"Try not to make the food look plain, dry, or unappetizing."
-            )
+        key = image_key(recipe)
 
-        image_data = ai_model.generate_image(image_prompt)
-        image_base64 = base64.b64encode(image_data).decode('utf-8') if image_data else None
+        # Serve an image pre-generated in the background, waiting for it if
+        # it is being generated right now
+        image_data = cache.get(key)
+        if image_data is None:
+            in_flight = image_prefetcher.claim(key)
+            if in_flight is not None:
+                await asyncio.to_thread(in_flight.wait, PREFETCH_WAIT)
+                image_data = cache.get(key)
+
+        if image_data is None:
+            image_data = ai_model.generate_image(build_image_prompt(recipe))
+            if image_data:
+                cache.set(key, image_data, ttl=IMAGE_TTL)
+
+        with phase("base64"):
+            image_base64 = base64.b64encode(image_data).decode('utf-8') if image_data else None
 
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -519,3 +632,70 @@ async def calculate_calories(file: UploadFile = File(...)) -> JSONResponse:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "message": str(e)}
         )
+
+
+def admin_forbidden() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_403_FORBIDDEN,
+        content={
+            "status": status.HTTP_403_FORBIDDEN,
+            "message": "Admin access required"
+        }
+    )
+
+@app.post("/admin/profile")
+async def capture_profile(seconds: float = 10, x_admin_token: Optional[str] = Header(None)):
+    if not profiler.is_admin(x_admin_token):
+        return admin_forbidden()
+
+    # Every worker samples its threads for the requested duration; the merged
+    # folded stacks can be fed to flamegraph.pl or speedscope
+    seconds = min(max(seconds, 0), MAX_PROFILE_SECONDS)
+    session_id = profiler.start_profile(seconds)
+    await asyncio.sleep(seconds + PROFILE_COLLECT_DELAY)
+    return PlainTextResponse(profiler.collect_profile(session_id))
+
+@app.put("/admin/profiler")
+async def configure_profiler(config: ProfilerConfig, x_admin_token: Optional[str] = Header(None)) -> JSONResponse:
+    if not profiler.is_admin(x_admin_token):
+        return admin_forbidden()
+
+    profiler.set_slow_threshold(config.slow_request_ms)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "status": status.HTTP_200_OK,
+            "message": "Slow request capture enabled" if config.slow_request_ms else "Slow request capture disabled",
+            "slowRequestMs": config.slow_request_ms
+        }
+    )
+
+@app.get("/admin/slow-requests")
+async def get_slow_requests(x_admin_token: Optional[str] = Header(None)) -> JSONResponse:
+    if not profiler.is_admin(x_admin_token):
+        return admin_forbidden()
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "status": status.HTTP_200_OK,
+            "message": "Slow requests retrieved successfully",
+            "slowRequests": profiler.get_slow_requests()
+        }
+    )
+
+@app.get("/admin/slow-requests/{request_id}/profile")
+async def get_slow_request_profile(request_id: str, x_admin_token: Optional[str] = Header(None)):
+    if not profiler.is_admin(x_admin_token):
+        return admin_forbidden()
+
+    profile = profiler.get_slow_request_profile(request_id)
+    if profile is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "status": status.HTTP_404_NOT_FOUND,
+                "message": "Slow request not found"
+            }
+        )
+    return PlainTextResponse(profile)
@@ -30,6 +30,8 @@ class MealPlanRequest(BaseModel):
     available_ingredients: Optional[str] = None
     dietary_goals: Optional[str] = None
     budget_constraints: Optional[str] = None
+    use_catalog: bool = True
+    pregenerate_images: bool = False
     id: str
     
 class MealPlanRetrieve(BaseModel):
@@ -38,3 +40,16 @@ class MealPlanRetrieve(BaseModel):
 class IndividualMealPlanRetrieve(BaseModel):
     id: str
     meal_id: str
+
+class MealPlanSearch(BaseModel):
+    id: str
+    query: str
+    page: int = 1
+    page_size: int = 10
+
+class NutritionAnalyticsRequest(BaseModel):
+    id: str
+    calories: Optional[int] = None
+
+class ProfilerConfig(BaseModel):
+    slow_request_ms: Optional[float] = None
@@ -0,0 +1,174 @@
+import re
+import warnings
+import numpy as np
+from typing import Optional, Dict, List, Any
+from api.parser import parse_meal_plan, parse_calorie_target, MACRO_FIELDS
+from api.cache import LRUCache
+
+_TITLE_CALORIES_PATTERN = re.compile(r"(\d+)cal\b")
+# Parsed plans are kept in process; a plan's arrays are a few hundred bytes
+MAX_CACHED_PLANS = 20000
+
+
+class PlanNutrition:
+    """Columnar macros for one stored meal plan, one row per meal."""
+
+    def __init__(self, plan_id: int, title: str, mealplan: str) -> None:
+        self.plan_id = plan_id
+        self.title = title
+
+        days = []
+        rows = []
+        for day in parse_meal_plan(mealplan):
+            for meal in day["meals"]:
+                days.append(day["day"])
+                rows.append([meal[macro] if meal[macro] is not None else np.nan for macro in MACRO_FIELDS])
+
+        self.days = np.asarray(days, dtype=np.int64)
+        self.macros = np.asarray(rows, dtype=np.float64).reshape(-1, len(MACRO_FIELDS))
+
+        target = parse_calorie_target(mealplan)
+        if target is None:
+            # Fall back to the "<calories>cal" part generate_meal_plan puts in titles
+            match = _TITLE_CALORIES_PATTERN.search(title or "")
+            target = float(match.group(1)) if match else None
+        self.calorie_target = target
+
+
+def _round(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(value) else round(float(value), 1) for value in values]
+
+
+def _nanmean(values: np.ndarray) -> np.ndarray:
+    # Columns with no values at all (e.g. a model that skipped fats) average to NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmean(values, axis=0)
+
+
+def _macro_dict(values: np.ndarray) -> Dict[str, Optional[float]]:
+    return dict(zip(MACRO_FIELDS, _round(values)))
+
+
+class NutritionAnalytics:
+    """Aggregates macros across all of a user's saved meal plans.
+
+    Parsing a plan is the expensive part, so each plan's macros are extracted
+    once into arrays and kept in an LRU cache by plan id; every request after
+    that only concatenates the cached arrays and aggregates them with NumPy.
+    """
+    _instance: Optional['NutritionAnalytics'] = None
+
+    def __new__(cls) -> 'NutritionAnalytics':
+        if cls._instance is None:
+            cls._instance = super(NutritionAnalytics, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self._plans = LRUCache(max_entries=MAX_CACHED_PLANS)
+
+    def _load_plans(self, db, user_id: str) -> List[PlanNutrition]:
+        query = """
+            SELECT id FROM mealplans
+            WHERE user_id = %s
+        """
+        plan_ids = sorted(int(row[0]) for row in db.execute_query(query, (user_id,)))
+        plans = {plan_id: self._plans.get(str(plan_id)) for plan_id in plan_ids}
+        missing = [plan_id for plan_id, plan in plans.items() if plan is None]
+
+        if missing:
+            # Only download the plan text for plans that have not been parsed yet
+            placeholders = ", ".join(["%s"] * len(missing))
+            query = f"""
+                SELECT id, title, mealplan FROM mealplans
+                WHERE user_id = %s AND id IN ({placeholders})
+            """
+            for plan_id, title, mealplan in db.execute_query(query, (user_id, *missing)):
+                plan = PlanNutrition(int(plan_id), title or "", mealplan or "")
+                self._plans.set(str(plan.plan_id), plan)
+                plans[plan.plan_id] = plan
+
+        return [plans[plan_id] for plan_id in plan_ids if plans[plan_id] is not None]
+
+    def summarize(self, db, user_id: str, calorie_target: Optional[int] = None) -> Dict[str, Any]:
+        plans = self._load_plans(db, str(user_id))
+        plans = [plan for plan in plans if len(plan.days)]
+        if not plans:
+            return {"planCount": 0, "dayCount": 0, "plans": [], "averages": None, "deviation": None}
+
+        # Columnar view over every meal of every plan
+        plan_index = np.concatenate([np.full(len(plan.days), i) for i, plan in enumerate(plans)])
+        days = np.concatenate([plan.days for plan in plans])
+        macros = np.concatenate([plan.macros for plan in plans])
+        has_value = ~np.isnan(macros)
+        values = np.where(has_value, macros, 0.0)
+
+        # Group meals by (plan, day) and sum each macro per group
+        day_keys, day_group = np.unique(np.stack([plan_index, days], axis=1), axis=0, return_inverse=True)
+        day_group = day_group.reshape(-1)
+        day_totals = np.zeros((len(day_keys), len(MACRO_FIELDS)))
+        np.add.at(day_totals, day_group, values)
+        day_counts = np.zeros((len(day_keys), len(MACRO_FIELDS)))
+        np.add.at(day_counts, day_group, has_value)
+        day_totals[day_counts == 0] = np.nan
+
+        # Per-week totals: each stored plan covers one week
+        week_totals = np.zeros((len(plans), len(MACRO_FIELDS)))
+        np.add.at(week_totals, plan_index, values)
+        week_counts = np.zeros((len(plans), len(MACRO_FIELDS)))
+        np.add.at(week_counts, plan_index, has_value)
+        week_totals[week_counts == 0] = np.nan
+
+        # Calorie targets per day: the request overrides what each plan asked for
+        plan_targets = np.array([
+            calorie_target if calorie_target else (plan.calorie_target or np.nan) for plan in plans
+        ], dtype=np.float64)
+        day_targets = plan_targets[day_keys[:, 0]]
+        day_calories = day_totals[:, MACRO_FIELDS.index("calories")]
+        day_deviation = day_calories - day_targets
+
+        valid_deviation = day_deviation[~np.isnan(day_deviation)]
+        valid_percent = (day_deviation / day_targets * 100)[~np.isnan(day_deviation)]
+        deviation = None
+        if len(valid_deviation):
+            deviation = {
+                "mean": round(float(valid_deviation.mean()), 1),
+                "meanAbsolute": round(float(np.abs(valid_deviation).mean()), 1),
+                "meanPercent": round(float(valid_percent.mean()), 1),
+                "std": round(float(valid_deviation.std()), 1),
+                "daysOverTarget": int((valid_deviation > 0).sum()),
+                "daysUnderTarget": int((valid_deviation < 0).sum()),
+            }
+
+        plan_summaries = []
+        for i, plan in enumerate(plans):
+            in_plan = day_keys[:, 0] == i
+            plan_summaries.append({
+                "id": plan.plan_id,
+                "title": plan.title,
+                "calorieTarget": None if np.isnan(plan_targets[i]) else float(plan_targets[i]),
+                "weekTotals": _macro_dict(week_totals[i]),
+                "dailyAverages": _macro_dict(_nanmean(day_totals[in_plan])),
+                "days": [
+                    {
+                        "day": int(day),
+                        "totals": _macro_dict(totals),
+                        "deviation": None if np.isnan(dev) else round(float(dev), 1),
+                    }
+                    for day, totals, dev in zip(day_keys[in_plan, 1], day_totals[in_plan], day_deviation[in_plan])
+                ],
+            })
+
+        averages = {
+            "perDay": _macro_dict(_nanmean(day_totals)),
+            "perWeek": _macro_dict(_nanmean(week_totals)),
+        }
+
+        return {
+            "planCount": len(plans),
+            "dayCount": len(day_keys),
+            "plans": plan_summaries,
+            "averages": averages,
+            "deviation": deviation,
+        }
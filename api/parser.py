@@ -0,0 +1,104 @@
+import re
+from typing import Optional, List, Dict, Any
+
+# The LLM sometimes wraps headings in markdown (e.g. "**Day 1:**"), so strip
+# emphasis/heading characters before matching
+_DAY_PATTERN = re.compile(r"^\s*[*#_\s]*Day\s+(\d+)\b", re.IGNORECASE)
+_MEAL_PATTERN = re.compile(r"^\s*[*#_\s]*Meal\s+(\d+)\b", re.IGNORECASE)
+_HEADER_PATTERN = re.compile(r"^\s*[*#_\s]*Meal\s+Plan\b", re.IGNORECASE)
+_FIELD_PATTERN = re.compile(r"^\s*[*#_\s]*([A-Za-z ]+?)\s*[*_]*:\s*[*_]*\s*(.*)$")
+_LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+\.)\s+(.*)$")
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+# The target is the number (optionally in brackets, as in the prompt's
+# template) directly followed by "Calories"/"kcal" or "Per Day", so
+# "Meal Plan for 1 Week - 2000 Calories" reads 2000 rather than 1
+_TARGET_PATTERN = re.compile(
+    r"\[?(\d+(?:\.\d+)?)\]?\s*(?:k?cal(?:ories)?\b|per\s+day\b)", re.IGNORECASE
+)
+MACRO_FIELDS = ("calories", "proteins", "fats", "carbohydrates")
+_KNOWN_FIELDS = {"recipe name", "ingredients", "instructions", *MACRO_FIELDS}
+
+
+def _clean(text: str) -> str:
+    return text.strip().strip("*_").strip()
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Return the first number in `text` (e.g. "~450 kcal" -> 450.0)."""
+    match = _NUMBER_PATTERN.search((text or "").replace(",", ""))
+    return float(match.group(0)) if match else None
+
+
+def parse_calorie_target(mealplan: str) -> Optional[float]:
+    """Read the daily calorie target from the "Meal Plan [N] Per Day" header."""
+    for line in (mealplan or "").splitlines():
+        if _DAY_PATTERN.match(line):
+            break
+        # Only the header counts; other lines (e.g. "Estimated Weekly Cost:
+        # $12 per day") can carry numbers that look like a target
+        if _HEADER_PATTERN.match(line):
+            match = _TARGET_PATTERN.search(line.replace(",", ""))
+            return float(match.group(1)) if match else None
+    return None
+
+
+def parse_meal_plan(mealplan: str) -> List[Dict[str, Any]]:
+    """Split a generated meal plan into days and meals.
+
+    Returns a list of days, each {"day": int, "meals": [...]}, where every meal
+    has its number, recipe name, ingredients, macros (None when missing) and
+    the raw text of the block.
+    """
+    days: List[Dict[str, Any]] = []
+    current_day = None
+    current_meal = None
+    section = None
+
+    for line in (mealplan or "").splitlines():
+        day_match = _DAY_PATTERN.match(line)
+        if day_match:
+            current_day = {"day": int(day_match.group(1)), "meals": []}
+            days.append(current_day)
+            current_meal = None
+            section = None
+            continue
+
+        meal_match = _MEAL_PATTERN.match(line)
+        if meal_match and current_day is not None:
+            current_meal = {
+                "meal": int(meal_match.group(1)),
+                "recipe_name": "",
+                "ingredients": [],
+                **{macro: None for macro in MACRO_FIELDS},
+                "text": line.strip() + "\n",
+            }
+            current_day["meals"].append(current_meal)
+            section = None
+            continue
+
+        if current_meal is None:
+            continue
+
+        current_meal["text"] += line.strip() + "\n"
+
+        field_match = _FIELD_PATTERN.match(line)
+        field = field_match.group(1).strip().lower() if field_match else None
+        if field in _KNOWN_FIELDS:
+            value = _clean(field_match.group(2))
+            if field == "recipe name":
+                current_meal["recipe_name"] = value
+                section = None
+            elif field == "ingredients":
+                section = "ingredients"
+            elif field in MACRO_FIELDS:
+                current_meal[field] = parse_number(value)
+                section = None
+            else:
+                section = None
+            continue
+
+        item_match = _LIST_ITEM_PATTERN.match(line)
+        if item_match and section == "ingredients":
+            current_meal["ingredients"].append(_clean(item_match.group(1)))
+
+    return days
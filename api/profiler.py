@@ -0,0 +1,417 @@
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple, Any
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse as BaseJSONResponse
+from api.cache import get_cache
+
+# Samples are counted per stack in buckets of this many seconds
+SAMPLE_BUCKET = 0.1
+# Samples are only kept while a tracked request or on-demand profile still
+# needs them, and never for longer than this
+MAX_SAMPLE_RETENTION = 60.0
+# Distinct stacks remembered before new ones are counted as "[other]"; the
+# table is rebuilt from the kept buckets when it fills up
+MAX_STACKS = 10000
+# Threads whose innermost frame is in one of these modules are waiting on a
+# lock, queue or selector (idle pool threads, the event loop between events)
+# and are not sampled
+IDLE_MODULES = frozenset({"threading.py", "queue.py", "selectors.py"})
+
+# Settings and results are shared with the other workers through the cache;
+# each worker checks for new settings at most this often
+CONFIG_KEY = "profiler:config"
+WORKERS_KEY = "profiler:workers"
+CONFIG_POLL_INTERVAL = 1.0
+RESULT_TTL = 24 * 60 * 60
+MAX_WORKERS = 64
+# How long after an on-demand profile ends to wait for every worker's result
+PROFILE_COLLECT_DELAY = 0.5
+
+
+class RequestProfile:
+    """Timing breakdown of one request, filled in by `phase` blocks."""
+
+    def __init__(self, method: str, path: str) -> None:
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_current_request: ContextVar[Optional[RequestProfile]] = ContextVar("current_request", default=None)
+
+
+class phase:
+    """Time a block of work (e.g. `with phase("gemini"):`) for the current request.
+
+    When profiling is off no request is tracked, so this only costs a
+    context variable lookup.
+    """
+    __slots__ = ("name", "record", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.record = _current_request.get()
+        if self.record is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        if self.record is not None:
+            self.record.add(self.name, time.perf_counter() - self.start)
+
+
+class JSONResponse(BaseJSONResponse):
+    """JSONResponse that reports serialization time as the "json" phase."""
+
+    def render(self, content: Any) -> bytes:
+        with phase("json"):
+            return super().render(content)
+
+
+class Profiler:
+    """On-demand sampling profiler with slow request capture.
+
+    A sampler thread records the Python stack of every thread at a fixed
+    interval, but only while an on-demand profile is being captured or slow
+    request capture is enabled; otherwise nothing runs. Stacks are interned
+    and counted per time bucket, threads idling in a wait are skipped, and
+    buckets are dropped once no request or profile in progress needs them.
+    Profiles are exported in the folded stack format read by flamegraph.pl
+    and speedscope, with each stack rooted at the worker's pid.
+
+    The slow request threshold and on-demand profiles are fanned out to every
+    worker through the shared cache, and each worker stores its slow request
+    records and profile results there, so any worker can answer the admin
+    endpoints. With the in-process cache fallback this is per worker.
+    """
+    _instance: Optional['Profiler'] = None
+
+    def __new__(cls) -> 'Profiler':
+        if cls._instance is None:
+            cls._instance = super(Profiler, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        load_dotenv()
+        self._admin_token = os.getenv("ADMIN_TOKEN")
+        slow_request_ms = os.getenv("PROFILE_SLOW_REQUEST_MS")
+        self.slow_threshold = float(slow_request_ms) / 1000 if slow_request_ms else None
+        self.interval = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 10)) / 1000
+        self.slow_requests: deque = deque(maxlen=int(os.getenv("PROFILE_SLOW_REQUEST_BUFFER", 50)))
+
+        self.max_retention = float(os.getenv("PROFILE_MAX_RETENTION_S", MAX_SAMPLE_RETENTION))
+        self.poll_interval = CONFIG_POLL_INTERVAL
+        self._cache = get_cache()
+        self._next_poll = 0.0
+        self._session_id: Optional[str] = None
+
+        # (bucket number, Counter of stack id -> samples), oldest first
+        self._buckets: deque = deque(maxlen=int(self.max_retention / SAMPLE_BUCKET) + 1)
+        # (thread name, code objects innermost first) -> stack id
+        self._stack_ids: Dict[Any, int] = {}
+        self._stacks: List[Any] = []
+        # Whether buckets were dropped since the stack table was last rebuilt
+        self._dropped = False
+        self._labels: Dict[Any, str] = {}
+        self._idle_codes: Dict[Any, bool] = {}
+        self._thread_names: Dict[int, str] = {}
+        # Start times of on-demand profiles and tracked requests in progress;
+        # profiles are keyed by session id with (start, wall clock end)
+        self._sessions: Dict[str, Tuple[float, float]] = {}
+        self._requests: Dict[int, float] = {}
+        # Finished slow requests waiting for the sampler thread to store them
+        self._slow: deque = deque()
+        self._samples_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self._sessions) or self.slow_threshold is not None
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        # Profiling is only available when an admin token is configured
+        if not self._admin_token or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self._admin_token.encode("utf-8"))
+
+    @property
+    def pid(self) -> int:
+        # Looked up on use, as the app may be imported before the server forks
+        return os.getpid()
+
+    def set_slow_threshold(self, milliseconds: Optional[float]) -> None:
+        """Set the slow request threshold for every worker; None turns capture off."""
+        self._update_config(slowRequestMs=milliseconds)
+        self._apply_threshold(milliseconds)
+
+    def _apply_threshold(self, milliseconds: Optional[float]) -> None:
+        self.slow_threshold = milliseconds / 1000 if milliseconds else None
+        self._ensure_sampler()
+
+    # Sharing with other workers
+
+    def _update_config(self, **changes: Any) -> None:
+        config = self._cache.get(CONFIG_KEY) or {}
+        config.update(changes)
+        self._cache.set(CONFIG_KEY, config)
+
+    def _poll(self) -> None:
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+
+        config = self._cache.get(CONFIG_KEY)
+        if not config:
+            return
+        if "slowRequestMs" in config:
+            milliseconds = config["slowRequestMs"]
+            if (milliseconds / 1000 if milliseconds else None) != self.slow_threshold:
+                self._apply_threshold(milliseconds)
+        session = config.get("session")
+        if session:
+            self._join_session(session["id"], session["until"])
+
+    def _publish(self, key: str, value: Any) -> None:
+        self._cache.set(key, value, ttl=RESULT_TTL)
+        # Keep this worker listed so the others know where to find its results
+        workers = [pid for pid in self._cache.get(WORKERS_KEY) or [] if pid != self.pid]
+        self._cache.set(WORKERS_KEY, (workers + [self.pid])[-MAX_WORKERS:], ttl=RESULT_TTL)
+
+    def _workers(self) -> List[int]:
+        workers = self._cache.get(WORKERS_KEY) or []
+        return workers if self.pid in workers else workers + [self.pid]
+
+    # Sampling
+
+    def _ensure_sampler(self) -> None:
+        with self._lock:
+            if self.active and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _is_idle(self, code) -> bool:
+        idle = self._idle_codes.get(code)
+        if idle is None:
+            idle = os.path.basename(code.co_filename) in IDLE_MODULES
+            self._idle_codes[code] = idle
+        return idle
+
+    def _thread_name(self, thread_id: int) -> str:
+        name = self._thread_names.get(thread_id)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.setdefault(thread_id, str(thread_id))
+        return name
+
+    def _stack_id(self, thread_id: int, frame) -> int:
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        key = (self._thread_name(thread_id), tuple(codes))
+        stack_id = self._stack_ids.get(key)
+        if stack_id is None:
+            if len(self._stacks) >= MAX_STACKS:
+                key = ("[other]", ())
+                stack_id = self._stack_ids.get(key)
+            if stack_id is None:
+                stack_id = len(self._stacks)
+                self._stack_ids[key] = stack_id
+                self._stacks.append(key)
+        return stack_id
+
+    def _compact(self) -> None:
+        """Rebuild the stack table with only the stacks kept buckets still count."""
+        live = sorted(set().union(*(counts.keys() for _, counts in self._buckets)))
+        new_ids = {stack_id: new_id for new_id, stack_id in enumerate(live)}
+        self._stacks = [self._stacks[stack_id] for stack_id in live]
+        self._stack_ids = {key: new_id for new_id, key in enumerate(self._stacks)}
+        for position, (bucket, counts) in enumerate(self._buckets):
+            self._buckets[position] = (bucket, Counter({new_ids[k]: n for k, n in counts.items()}))
+        self._dropped = False
+
+    def _render(self, stack_id: int) -> str:
+        thread_name, codes = self._stacks[stack_id]
+        return ";".join([thread_name] + [self._label(code) for code in reversed(codes)])
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while self.active:
+            now = time.perf_counter()
+            bucket = int(now / SAMPLE_BUCKET)
+            # Drop buckets nothing in progress can still ask for
+            starts = [started for started, until in self._sessions.values()]
+            oldest = min(starts + list(self._requests.values()), default=now)
+            cutoff = int(max(oldest, now - self.max_retention) / SAMPLE_BUCKET)
+
+            with self._samples_lock:
+                if len(self._stacks) >= MAX_STACKS and self._dropped:
+                    self._compact()
+                if not self._buckets or self._buckets[-1][0] != bucket:
+                    # A full deque drops its oldest bucket on append
+                    self._dropped = self._dropped or len(self._buckets) == self._buckets.maxlen
+                    self._buckets.append((bucket, Counter()))
+                self._buckets[-1][1].update(
+                    self._stack_id(thread_id, frame)
+                    for thread_id, frame in sys._current_frames().items()
+                    if thread_id != own_id and not self._is_idle(frame.f_code)
+                )
+                while self._buckets and self._buckets[0][0] < cutoff:
+                    self._buckets.popleft()
+                    self._dropped = True
+
+            if self._sessions:
+                self._finish_sessions()
+            if self._slow:
+                self._store_slow_requests()
+            self._poll()
+            time.sleep(self.interval)
+
+        self._store_slow_requests()
+        with self._samples_lock:
+            self._buckets.clear()
+            self._stack_ids.clear()
+            self._stacks.clear()
+
+    def folded(self, start: float, end: float) -> str:
+        """Folded stacks ("frame;frame;frame count") sampled between start and end."""
+        first, last = int(start / SAMPLE_BUCKET), int(end / SAMPLE_BUCKET)
+        counts: Counter = Counter()
+        with self._samples_lock:
+            for bucket, bucket_counts in self._buckets:
+                if first <= bucket <= last:
+                    counts.update(bucket_counts)
+            return "\n".join(
+                f"worker {self.pid};{self._render(stack_id)} {count}"
+                for stack_id, count in counts.most_common()
+            )
+
+    # On-demand profiles
+
+    def start_profile(self, seconds: float) -> str:
+        """Ask every worker to sample for `seconds`; returns the session id."""
+        session_id = uuid.uuid4().hex
+        until = time.time() + seconds
+        self._update_config(session={"id": session_id, "until": until})
+        self._join_session(session_id, until)
+        return session_id
+
+    def _join_session(self, session_id: str, until: float) -> None:
+        with self._lock:
+            if session_id == self._session_id or until <= time.time():
+                return
+            self._session_id = session_id
+            self._sessions[session_id] = (time.perf_counter(), until)
+        self._ensure_sampler()
+
+    def _finish_sessions(self) -> None:
+        now = time.time()
+        for session_id, (started, until) in list(self._sessions.items()):
+            if now >= until:
+                self._publish(f"profiler:profile:{session_id}:{self.pid}", self.folded(started, time.perf_counter()))
+                with self._lock:
+                    del self._sessions[session_id]
+
+    def collect_profile(self, session_id: str) -> str:
+        """Merge the folded stacks every worker stored for a finished profile."""
+        lines = []
+        for pid in self._workers():
+            profile = self._cache.get(f"profiler:profile:{session_id}:{pid}")
+            if profile:
+                lines.extend(profile.splitlines())
+        lines.sort(key=lambda line: -int(line.rsplit(" ", 1)[1]))
+        return "\n".join(lines)
+
+    # Slow request capture
+
+    def begin_request(self, method: str, path: str):
+        """Start tracking a request; returns None when profiling is off."""
+        self._poll()
+        if not self.active:
+            return None
+        if self._thread is None or not self._thread.is_alive():
+            self._ensure_sampler()
+        record = RequestProfile(method, path)
+        self._requests[id(record)] = record.start
+        return record, _current_request.set(record)
+
+    def end_request(self, tracked) -> None:
+        record, token = tracked
+        _current_request.reset(token)
+        record.end = time.perf_counter()
+        duration = record.end - record.start
+
+        if self.slow_threshold is None or duration < self.slow_threshold:
+            self._requests.pop(id(record), None)
+            return
+        # Rendering and storing the profile is left to the sampler thread, so
+        # the request and the event loop only pay for recording the timings
+        self._slow.append(record)
+
+    def _store_slow_requests(self) -> None:
+        while self._slow:
+            record = self._slow.popleft()
+            self._store_slow_request(record)
+            self._requests.pop(id(record), None)
+
+    def _store_slow_request(self, record: RequestProfile) -> None:
+        duration = record.end - record.start
+        phases = {name: round(seconds * 1000, 2) for name, seconds in record.phases.items()}
+        phases["other"] = round(max(duration - sum(record.phases.values()), 0.0) * 1000, 2)
+        entry = {
+            "id": f"{self.pid}-{next(self._ids)}",
+            "pid": self.pid,
+            "method": record.method,
+            "path": record.path,
+            "startedAt": record.started_at,
+            "durationMs": round(duration * 1000, 2),
+            "phasesMs": phases,
+        }
+        with self._lock:
+            evicted = self.slow_requests[0] if len(self.slow_requests) == self.slow_requests.maxlen else None
+            self.slow_requests.append(entry)
+            entries = list(self.slow_requests)
+
+        # Samples cover every thread, so concurrent requests show up too
+        self._publish(f"profiler:slow-request:{entry['id']}", self.folded(record.start, record.end))
+        self._publish(f"profiler:slow-requests:{self.pid}", entries)
+        if evicted is not None:
+            self._cache.delete(f"profiler:slow-request:{evicted['id']}")
+
+    def get_slow_requests(self) -> List[Dict[str, Any]]:
+        """Recent slow requests of every worker, newest first."""
+        entries = []
+        for pid in self._workers():
+            entries.extend(self._cache.get(f"profiler:slow-requests:{pid}") or [])
+        entries.sort(key=lambda entry: entry["startedAt"], reverse=True)
+        return entries
+
+    def get_slow_request_profile(self, request_id: str) -> Optional[str]:
+        return self._cache.get(f"profiler:slow-request:{request_id}")
@@ -0,0 +1,185 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Optional, Dict, List, Set, Tuple, Any
+from api.parser import parse_meal_plan
+from api.cache import LRUCache
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Matches in a recipe name count more than matches in the plan title, which
+# count more than matches in an ingredient line
+FIELD_WEIGHTS = {
+    "recipe": 3.0,
+    "title": 2.0,
+    "ingredient": 1.0,
+}
+
+# Prefix expansions are ranked below exact term matches
+PREFIX_PENALTY = 0.5
+
+# Indexes of the least recently searched users are dropped past this many
+MAX_INDEXED_USERS = 1000
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+class _UserIndex:
+    """Inverted index over the meal plans of a single user."""
+
+    def __init__(self) -> None:
+        # term -> {plan_id: weighted term frequency}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        # sorted vocabulary, used for prefix lookups with bisect
+        self.terms: List[str] = []
+        self.titles: Dict[int, str] = {}
+        self.recipes: Dict[int, List[str]] = {}
+
+    def add(self, plan_id: int, title: str, mealplan: str) -> None:
+        if plan_id in self.titles:
+            return
+
+        recipe_names = []
+        weights: Dict[str, float] = defaultdict(float)
+        for token in tokenize(title):
+            weights[token] += FIELD_WEIGHTS["title"]
+        for day in parse_meal_plan(mealplan):
+            for meal in day["meals"]:
+                if meal["recipe_name"]:
+                    recipe_names.append(meal["recipe_name"])
+                for token in tokenize(meal["recipe_name"]):
+                    weights[token] += FIELD_WEIGHTS["recipe"]
+                for ingredient in meal["ingredients"]:
+                    for token in tokenize(ingredient):
+                        weights[token] += FIELD_WEIGHTS["ingredient"]
+
+        for term, weight in weights.items():
+            if term not in self.postings:
+                bisect.insort(self.terms, term)
+            self.postings[term][plan_id] = weight
+
+        self.titles[plan_id] = title
+        self.recipes[plan_id] = recipe_names
+
+    def expand(self, term: str) -> List[Tuple[str, float]]:
+        """Return indexed terms matching `term` exactly or as a prefix."""
+        matches = []
+        position = bisect.bisect_left(self.terms, term)
+        while position < len(self.terms) and self.terms[position].startswith(term):
+            candidate = self.terms[position]
+            matches.append((candidate, 1.0 if candidate == term else PREFIX_PENALTY))
+            position += 1
+        return matches
+
+    def search(self, query: str) -> List[Tuple[int, float, Set[str]]]:
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+
+        total = len(self.titles)
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, Set[str]] = defaultdict(set)
+        # every query term must match (exactly or by prefix) for a plan to be returned
+        candidates: Optional[Set[int]] = None
+
+        for term in query_terms:
+            term_candidates: Set[int] = set()
+            for candidate, boost in self.expand(term):
+                postings = self.postings[candidate]
+                idf = math.log(1 + total / len(postings))
+                for plan_id, weight in postings.items():
+                    scores[plan_id] += boost * idf * (1 + math.log(weight))
+                    matched[plan_id].add(candidate)
+                    term_candidates.add(plan_id)
+            candidates = term_candidates if candidates is None else candidates & term_candidates
+            if not candidates:
+                return []
+
+        results = [(plan_id, scores[plan_id], matched[plan_id]) for plan_id in candidates]
+        results.sort(key=lambda result: (-result[1], -result[0]))
+        return results
+
+
+class MealPlanSearchIndex:
+    """In-process inverted index over saved meal plans.
+
+    Each user's index is built from the database the first time they search and
+    is then kept up to date incrementally: `add_mealplan` is called on insert,
+    and `search` picks up rows saved by other workers by comparing the user's
+    plan ids with the indexed ones and loading only the missing plans. Only
+    the most recently searched users are kept.
+    """
+    _instance: Optional['MealPlanSearchIndex'] = None
+
+    def __new__(cls) -> 'MealPlanSearchIndex':
+        if cls._instance is None:
+            cls._instance = super(MealPlanSearchIndex, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self._indexes = LRUCache(max_entries=MAX_INDEXED_USERS)
+        self._lock = threading.Lock()
+
+    def _sync(self, db, user_id: str) -> _UserIndex:
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = _UserIndex()
+            self._indexes.set(user_id, index)
+
+        query = """
+            SELECT id FROM mealplans
+            WHERE user_id = %s
+        """
+        # Ids are not inserted in order across workers, so diff the full id
+        # list rather than loading everything above the highest indexed id
+        plan_ids = [int(row[0]) for row in db.execute_query(query, (user_id,))]
+        missing = [plan_id for plan_id in plan_ids if plan_id not in index.titles]
+
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            query = f"""
+                SELECT id, title, mealplan FROM mealplans
+                WHERE user_id = %s AND id IN ({placeholders})
+            """
+            for plan_id, title, mealplan in db.execute_query(query, (user_id, *missing)):
+                index.add(int(plan_id), title or "", mealplan or "")
+        return index
+
+    def add_mealplan(self, user_id: str, plan_id: int, title: str, mealplan: str) -> None:
+        with self._lock:
+            # Only maintain indexes that have already been loaded; an unloaded
+            # user's plans are picked up in full on their first search
+            index = self._indexes.get(str(user_id))
+            if index is not None:
+                index.add(int(plan_id), title, mealplan)
+
+    def search(self, db, user_id: str, query: str, page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            index = self._sync(db, str(user_id))
+            results = index.search(query)
+
+            start = (page - 1) * page_size
+            page_results = [
+                {
+                    "id": plan_id,
+                    "title": index.titles[plan_id],
+                    "score": round(score, 4),
+                    "recipes": [
+                        name for name in index.recipes[plan_id]
+                        if matched & set(tokenize(name))
+                    ],
+                }
+                for plan_id, score, matched in results[start:start + page_size]
+            ]
+
+        return {
+            "total": len(results),
+            "page": page,
+            "pageSize": page_size,
+            "results": page_results,
+        }
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import stat
+import tempfile
+import time
+import pytest
+from api.cache import LRUCache, SQLiteCache, _private_cache_dir
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return LRUCache(max_bytes=120)
+    return SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=120, access_update_interval=0)
+
+
+def test_get_set_delete(cache):
+    assert cache.get("missing") is None
+    cache.set("plan", {"id": 1})
+    assert cache.get("plan") == {"id": 1}
+    assert cache.contains("plan")
+    cache.delete("plan")
+    assert not cache.contains("plan")
+    assert cache.get("plan", "default") == "default"
+
+
+def test_entries_expire(cache):
+    cache.set("plan", "value", ttl=0.05)
+    assert cache.get("plan") == "value"
+    time.sleep(0.1)
+    assert not cache.contains("plan")
+    assert cache.get("plan") is None
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.set("a", b"x" * 50)
+    time.sleep(0.01)
+    cache.set("b", b"x" * 50)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", b"x" * 50)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_sqlite_cache_keeps_a_running_size_total(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=1000)
+    cache.set("a", b"x" * 100)
+    cache.set("b", b"x" * 200)
+    cache.set("a", b"x" * 50)
+    cache.delete("b")
+    assert cache._total() == 50
+
+    for i in range(30):
+        cache.set(f"plan-{i}", b"x" * 100)
+    assert cache._total() <= 1000
+    assert cache._total() == cache._execute("SELECT SUM(size) FROM cache_entries")[0][0]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_sqlite_cache_is_shared_with_forked_workers(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("before-fork", 1)
+
+    pid = os.fork()
+    if pid == 0:
+        ok = cache.get("before-fork") == 1
+        cache.set("from-worker", 2)
+        os._exit(0 if ok else 1)
+
+    _, exit_status = os.waitpid(pid, 0)
+    assert exit_status == 0
+    assert cache.get("from-worker") == 2
+
+
+def test_sqlite_cache_stores_only_plain_values(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("image", b"\x89PNG")
+    cache.set("plan", "Day 1:")
+    cache.set("rows", [(1, "Meal Plan")])
+    assert cache.get("image") == b"\x89PNG"
+    assert cache.get("plan") == "Day 1:"
+    assert cache.get("rows") == [[1, "Meal Plan"]]
+
+    with pytest.raises(TypeError):
+        cache.set("object", object())
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="requires POSIX permissions")
+def test_default_cache_directory_is_private(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    path = _private_cache_dir()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+
+    os.chmod(path, 0o777)
+    with pytest.raises(PermissionError):
+        _private_cache_dir()
+
+
+def test_sqlite_errors_are_treated_as_a_miss(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("plan", "Day 1:")
+
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "_connection", locked)
+    assert cache.get("plan", "default") == "default"
+    cache.set("plan", "Day 2:")
+    cache.delete("plan")
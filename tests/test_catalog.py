@@ -0,0 +1,112 @@
+import pytest
+from api.catalog import RecipeCatalog
+from api.models import MealPlanRequest
+from api.parser import parse_meal_plan
+
+
+def make_plan(prefix, days=7, calories=700):
+    lines = ["Meal Plan 2100 Per Day", ""]
+    for day in range(1, days + 1):
+        lines.append(f"Day {day}:")
+        for meal in range(1, 4):
+            lines += [
+                f"Meal {meal}:",
+                f"Recipe Name: {prefix} Dish {day}-{meal}",
+                "Ingredients:",
+                "- rice",
+                "- chicken" if meal == 2 else "- beans",
+                "",
+                f"Calories: {calories}",
+                "---------------------------------------------",
+            ]
+    return "\n".join(lines)
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate_recipes(self, prompt, count):
+        self.calls.append(count)
+        return "\n".join(
+            f"Meal {i}:\nRecipe Name: Fresh {i}\nIngredients:\n- tofu\nCalories: 700\n" for i in range(1, count + 1)
+        )
+
+
+@pytest.fixture
+def catalog():
+    RecipeCatalog._instance = None
+    yield RecipeCatalog()
+    RecipeCatalog._instance = None
+
+
+def request(user_id="7", **fields):
+    return MealPlanRequest(id=user_id, cuisine="Mexican", calories=2100, meals_per_day=3, **fields)
+
+
+def test_assemble_fills_week_from_catalog(catalog):
+    catalog.add_meal_plan(request("1"), make_plan("Mexican"))
+    model = FakeModel()
+
+    mealplan = catalog.assemble_meal_plan(request(), "Generate a meal plan", model)
+    days = parse_meal_plan(mealplan)
+    assert model.calls == []
+    assert len(days) == 7
+    assert all(len(day["meals"]) == 3 for day in days)
+    assert days[0]["meals"][0]["calories"] == 700
+
+
+def test_assemble_generates_only_missing_slots(catalog):
+    catalog.add_meal_plan(request("1"), make_plan("Mexican", days=5))
+    model = FakeModel()
+
+    mealplan = catalog.assemble_meal_plan(request(), "Generate a meal plan", model)
+    assert model.calls == [6]
+    assert "Fresh 6" in mealplan
+
+
+def test_assemble_respects_constraints(catalog):
+    catalog.add_meal_plan(request("1"), make_plan("Mexican"))
+    model = FakeModel()
+
+    assert catalog.assemble_meal_plan(request(disliked_ingredients="beans"), "", model) is None
+    assert catalog.assemble_meal_plan(request(cooking_time="quick"), "", model) is None
+    assert catalog.assemble_meal_plan(
+        MealPlanRequest(id="7", cuisine="Italian", calories=2100, meals_per_day=3), "", model
+    ) is None
+    assert model.calls == []
+
+
+def test_assemble_requires_requested_ingredients(catalog):
+    catalog.add_meal_plan(request("1"), make_plan("Mexican"))
+    model = FakeModel()
+
+    assert catalog.assemble_meal_plan(request(ingredients="salmon"), "", model) is None
+
+    # Only the chicken slot of each day can be reused, which is less than half the week
+    assert catalog.assemble_meal_plan(request(ingredients="chicken"), "", model) is None
+
+    mealplan = catalog.assemble_meal_plan(request(ingredients="chicken, beans"), "", model)
+    assert mealplan is not None
+    assert model.calls == []
+
+
+def test_assemble_picks_different_weeks(catalog):
+    catalog.add_meal_plan(request("1"), make_plan("Mexican"))
+    catalog.add_meal_plan(request("2"), make_plan("Spicy"))
+    model = FakeModel()
+
+    first = catalog.assemble_meal_plan(request("7"), "", model)
+    assert first != catalog.assemble_meal_plan(request("8"), "", model)
+
+    # The same user never gets recipes from their recent plans again
+    second = catalog.assemble_meal_plan(request("7"), "", model)
+    first_names = {meal["recipe_name"] for day in parse_meal_plan(first) for meal in day["meals"]}
+    second_names = {meal["recipe_name"] for day in parse_meal_plan(second) for meal in day["meals"]}
+    assert not first_names & second_names
+    assert model.calls == []
+
+
+def test_assemble_skips_the_users_own_recent_plans(catalog):
+    catalog.add_meal_plan(request(), make_plan("Mexican"))
+    assert catalog.assemble_meal_plan(request(), "", FakeModel()) is None
@@ -0,0 +1,93 @@
+import threading
+import pytest
+import api.cache
+from api.cache import LRUCache
+from api.images import ImagePrefetcher, image_key
+
+PLAN = """
+Day 1:
+Meal 1:
+Recipe Name: Oatmeal
+Calories: 400
+
+Meal 2:
+Recipe Name: Chicken Salad
+Calories: 600
+
+Day 2:
+Meal 1:
+Recipe Name: Pasta
+Calories: 900
+"""
+
+
+class FakeModel:
+    def __init__(self):
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate_image(self, prompt):
+        self.release.wait(5)
+        self.prompts.append(prompt)
+        return b"image"
+
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    monkeypatch.setattr(api.cache, "_shared_cache", LRUCache())
+    ImagePrefetcher._instance = None
+    yield ImagePrefetcher()
+    ImagePrefetcher._instance = None
+
+
+def wait_until(predicate):
+    for _ in range(100):
+        if predicate():
+            return True
+        threading.Event().wait(0.02)
+    return False
+
+
+def test_schedule_pregenerates_each_day(prefetcher):
+    model = FakeModel()
+    assert prefetcher.schedule(PLAN, model) == 2
+
+    day_one = "Meal 1:\nRecipe Name: Oatmeal\n\nMeal 2:\nRecipe Name: Chicken Salad\n"
+    day_two = "Meal 1:\nRecipe Name: Pasta\n"
+    cache = api.cache.get_cache()
+    assert wait_until(lambda: cache.get(image_key(day_two)) is not None)
+    assert cache.get(image_key(day_one)) == b"image"
+    assert "Oatmeal, Chicken Salad" in model.prompts[0]
+
+    # Already generated days are not queued again
+    assert prefetcher.schedule(PLAN, model) == 0
+
+
+def test_claim_cancels_queued_jobs_and_waits_for_running_ones(prefetcher):
+    model = FakeModel()
+    model.release.clear()
+    prefetcher.schedule(PLAN, model)
+
+    day_two = "Meal 1:\nRecipe Name: Pasta\n"
+    assert prefetcher.claim(image_key(day_two)) is None
+
+    day_one = "Meal 1:\nRecipe Name: Oatmeal\nMeal 2:\nRecipe Name: Chicken Salad\n"
+    assert wait_until(lambda: prefetcher._running is not None)
+    running = prefetcher.claim(image_key(day_one))
+    assert running is not None
+
+    model.release.set()
+    assert running.wait(5)
+    assert len(model.prompts) == 1
+
+
+def test_jobs_wait_while_foreground_load_is_high(prefetcher):
+    prefetcher.max_foreground = 0
+    prefetcher.poll_interval = 0.01
+    model = FakeModel()
+
+    with prefetcher.foreground():
+        prefetcher.schedule(PLAN, model)
+        threading.Event().wait(0.1)
+        assert model.prompts == []
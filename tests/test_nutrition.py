@@ -0,0 +1,101 @@
+import pytest
+from api.nutrition import NutritionAnalytics
+from api.parser import parse_calorie_target
+
+PLAN = """
+**Meal Plan 2000 Calories Per Day**
+
+Day 1:
+Meal 1:
+Recipe Name: Oatmeal
+Calories: 800
+Proteins: 30g
+Fats: 20g
+Carbohydrates: 100g
+
+Meal 2:
+Recipe Name: Chicken Salad
+Calories: 1400 kcal
+Proteins: 90g
+Fats: 40g
+Carbohydrates: 80g
+
+Day 2:
+Meal 1:
+Recipe Name: Pasta
+Calories: 1800
+Proteins: 60g
+Fats: 50g
+Carbohydrates: 250g
+"""
+
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.downloads = 0
+
+    def execute_query(self, query, values=None):
+        if "mealplan FROM" in query:
+            self.downloads += 1
+            return [row for row in self.rows if row[0] in values[1:]]
+        return [(row[0],) for row in self.rows]
+
+
+@pytest.fixture
+def analytics():
+    NutritionAnalytics._instance = None
+    yield NutritionAnalytics()
+    NutritionAnalytics._instance = None
+
+
+def test_summarize_totals_and_deviation(analytics):
+    db = FakeDatabase([(1, "Meal Plan - 2000cal", PLAN)])
+
+    summary = analytics.summarize(db, "7")
+    plan = summary["plans"][0]
+    assert summary["dayCount"] == 2
+    assert plan["calorieTarget"] == 2000
+    assert plan["days"][0]["totals"]["calories"] == 2200
+    assert plan["days"][0]["deviation"] == 200
+    assert plan["days"][1]["deviation"] == -200
+    assert plan["weekTotals"]["proteins"] == 180
+    assert summary["averages"]["perDay"]["calories"] == 2000
+    assert summary["deviation"]["meanAbsolute"] == 200
+
+    assert analytics.summarize(db, "7", calorie_target=1800)["deviation"]["mean"] == 200
+
+
+def test_summarize_parses_each_plan_once(analytics):
+    db = FakeDatabase([(1, "Meal Plan", PLAN)])
+    analytics.summarize(db, "7")
+    analytics.summarize(db, "7")
+    assert db.downloads == 1
+
+    db.rows.append((2, "Meal Plan", PLAN))
+    assert analytics.summarize(db, "7")["planCount"] == 2
+    assert db.downloads == 2
+
+
+@pytest.mark.parametrize("header, target", [
+    ("Meal Plan 2000 Per Day", 2000),
+    ("Meal Plan (2,000 Calories Per Day)", 2000),
+    ("**Meal Plan: 1,800 Calories Per Day**", 1800),
+    ("Meal Plan for 1 Week - 2000 Calories", 2000),
+    ("Meal Plan 1 Week, 1500 kcal", 1500),
+    ("Meal Plan [1800] Per Day", 1800),
+    ("## Meal Plan 1800 Calories Per Day", 1800),
+])
+def test_parse_calorie_target_header_shapes(header, target):
+    assert parse_calorie_target(f"{header}\n\nDay 1:\nMeal 1:\nCalories: 500\n") == target
+
+
+def test_parse_calorie_target_ignores_other_header_lines():
+    mealplan = "Estimated Weekly Cost: $12 per day\nMeal Plan for 1 Week\n\nDay 1:\nMeal 1:\nCalories: 500\n"
+    assert parse_calorie_target(mealplan) is None
+
+
+def test_calorie_target_falls_back_to_title(analytics):
+    plan = "Meal Plan for 1 Week\n\nDay 1:\nMeal 1:\nRecipe Name: Oatmeal\nCalories: 1700\n"
+    db = FakeDatabase([(1, "Meal Plan - Italian 1800cal - May 01, 2025", plan)])
+    assert analytics.summarize(db, "7")["plans"][0]["calorieTarget"] == 1800
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import pytest
+from api.cache import LRUCache, SQLiteCache
+from api.profiler import Profiler, phase
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.delenv("PROFILE_SLOW_REQUEST_MS", raising=False)
+    Profiler._instance = None
+    profiler = Profiler()
+    profiler._cache = LRUCache()
+    profiler.interval = 0.001
+    profiler.poll_interval = 0
+    yield profiler
+    profiler.set_slow_threshold(None)
+    Profiler._instance = None
+
+
+def busy_gemini_call(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def wait_until(predicate):
+    for _ in range(100):
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_requests_are_not_tracked_when_disabled(profiler):
+    assert profiler.begin_request("POST", "/login") is None
+    assert profiler._thread is None
+
+
+def test_slow_requests_are_captured_with_phases_and_profile(profiler, monkeypatch):
+    rendered_by = []
+    folded = profiler.folded
+
+    def tracking_folded(start, end):
+        rendered_by.append(threading.current_thread())
+        return folded(start, end)
+
+    monkeypatch.setattr(profiler, "folded", tracking_folded)
+    profiler.set_slow_threshold(50)
+
+    fast = profiler.begin_request("GET", "/about")
+    profiler.end_request(fast)
+
+    tracked = profiler.begin_request("POST", "/generate-meal-plan")
+    with phase("gemini"):
+        busy_gemini_call(0.1)
+    profiler.end_request(tracked)
+
+    # The profile is rendered and stored by the sampler thread, not by end_request
+    assert wait_until(profiler.get_slow_requests)
+    assert threading.current_thread() not in rendered_by
+    slow_requests = profiler.get_slow_requests()
+    assert len(slow_requests) == 1
+    assert slow_requests[0]["path"] == "/generate-meal-plan"
+    assert slow_requests[0]["phasesMs"]["gemini"] >= 100
+    assert "profile" not in slow_requests[0]
+
+    profile = profiler.get_slow_request_profile(slow_requests[0]["id"])
+    assert "busy_gemini_call" in profile
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in profile.splitlines())
+
+
+def on_demand_profile(profiler, work, seconds=0.1):
+    session_id = profiler.start_profile(seconds)
+    work()
+    time.sleep(seconds + 0.1)
+    return profiler.collect_profile(session_id)
+
+
+def test_on_demand_profile(profiler):
+    profile = on_demand_profile(profiler, lambda: busy_gemini_call(0.05))
+    assert "busy_gemini_call" in profile
+    assert profile.startswith(f"worker {profiler.pid};")
+
+
+def test_idle_threads_are_skipped_and_samples_are_not_retained(profiler):
+    stop = threading.Event()
+    idle = threading.Thread(target=stop.wait, name="idle-worker", daemon=True)
+    idle.start()
+    try:
+        profile = on_demand_profile(profiler, lambda: busy_gemini_call(0.05))
+    finally:
+        stop.set()
+
+    assert "busy_gemini_call" in profile
+    assert "idle-worker" not in profile
+    # Repeated samples of the same stack share one interned entry
+    assert len(profile.splitlines()) < 10
+
+    # With nothing in progress, old buckets are dropped
+    profiler.set_slow_threshold(50)
+    busy_gemini_call(0.05)
+    time.sleep(0.3)
+    assert len(profiler._buckets) <= 2
+
+
+def test_admin_token_is_required(profiler):
+    assert profiler.is_admin("secret")
+    assert not profiler.is_admin("wrong")
+    assert not profiler.is_admin(None)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_settings_and_results_are_shared_between_workers(profiler, tmp_path):
+    profiler._cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+
+    pid = os.fork()
+    if pid == 0:
+        # A second worker: picks up the threshold set by the first one
+        tracked = None
+        deadline = time.monotonic() + 5
+        while tracked is None and time.monotonic() < deadline:
+            tracked = profiler.begin_request("POST", "/generate-meal-plan")
+            time.sleep(0.01)
+        if tracked is not None:
+            busy_gemini_call(0.1)
+            profiler.end_request(tracked)
+        os._exit(0 if tracked is not None and wait_until(lambda: profiler.slow_requests) else 1)
+
+    profiler.set_slow_threshold(50)
+    _, exit_status = os.waitpid(pid, 0)
+    assert exit_status == 0
+
+    slow_requests = profiler.get_slow_requests()
+    assert [entry["pid"] for entry in slow_requests] == [pid]
+    assert profiler.get_slow_request_profile(slow_requests[0]["id"]).startswith(f"worker {pid};")
+
+
+def test_stack_table_drops_stacks_no_longer_sampled(profiler, monkeypatch):
+    monkeypatch.setattr("api.profiler.MAX_STACKS", 5)
+    profiler.max_retention = 0.2
+    profiler.set_slow_threshold(50)
+
+    def make_stack(depth):
+        # Each depth gives a distinct stack
+        if depth:
+            return make_stack(depth - 1)
+        busy_gemini_call(0.03)
+
+    for depth in range(20):
+        make_stack(depth)
+    time.sleep(0.3)
+
+    tracked = profiler.begin_request("POST", "/generate-meal-plan")
+    busy_gemini_call(0.1)
+    profiler.end_request(tracked)
+    assert wait_until(profiler.get_slow_requests)
+    profile = profiler.get_slow_request_profile(profiler.get_slow_requests()[0]["id"])
+    assert "busy_gemini_call" in profile
+    assert "[other]" not in profile
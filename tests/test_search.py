@@ -0,0 +1,90 @@
+import pytest
+from api.search import MealPlanSearchIndex
+
+PLAN = """
+Meal Plan 2000 Per Day
+
+Day 1:
+Meal 1:
+Recipe Name: Lemon Chicken Bowl
+Ingredients:
+- 200g chicken breast
+- 1 lemon
+
+Calories: 500
+
+Day 2:
+Meal 1:
+Recipe Name: Tofu Stir Fry
+Ingredients:
+- 150g tofu
+- broccoli
+"""
+
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute_query(self, query, values=None):
+        if "mealplan FROM" in query:
+            return [row for row in self.rows if row[0] in values[1:]]
+        return [(row[0],) for row in self.rows]
+
+
+@pytest.fixture
+def index():
+    MealPlanSearchIndex._instance = None
+    yield MealPlanSearchIndex()
+    MealPlanSearchIndex._instance = None
+
+
+def test_search_ranks_recipe_names_and_matches_prefixes(index):
+    db = FakeDatabase([
+        (1, "Meal Plan - Italian", PLAN),
+        (2, "Meal Plan - Chicken Week", "Day 1:\nMeal 1:\nRecipe Name: Rice\n"),
+    ])
+
+    results = index.search(db, "7", "chick")
+    assert [result["id"] for result in results["results"]] == [1, 2]
+    assert results["results"][0]["recipes"] == ["Lemon Chicken Bowl"]
+
+    assert index.search(db, "7", "tofu broc")["total"] == 1
+    assert index.search(db, "7", "salmon")["total"] == 0
+
+
+def test_search_picks_up_new_plans_and_paginates(index):
+    db = FakeDatabase([(1, "Meal Plan - Chicken", PLAN)])
+    assert index.search(db, "7", "chicken")["total"] == 1
+
+    index.add_mealplan("7", 2, "Meal Plan - More Chicken", PLAN)
+    db.rows.append((3, "Meal Plan - Chicken Again", PLAN))
+
+    results = index.search(db, "7", "chicken", page=2, page_size=2)
+    assert results["total"] == 3
+    assert len(results["results"]) == 1
+
+
+def test_search_indexes_plans_inserted_out_of_order_by_other_workers(index):
+    db = FakeDatabase([(1, "Meal Plan - Chicken", PLAN)])
+    assert index.search(db, "7", "chicken")["total"] == 1
+
+    # Another worker saves plan 2, then this worker saves plan 3
+    db.rows.append((2, "Meal Plan - Chicken Again", PLAN))
+    db.rows.append((3, "Meal Plan - More Chicken", PLAN))
+    index.add_mealplan("7", 3, "Meal Plan - More Chicken", PLAN)
+
+    assert index.search(db, "7", "chicken")["total"] == 3
+
+
+def test_least_recently_searched_users_are_evicted(monkeypatch):
+    monkeypatch.setattr("api.search.MAX_INDEXED_USERS", 1)
+    MealPlanSearchIndex._instance = None
+    index = MealPlanSearchIndex()
+    db = FakeDatabase([(1, "Meal Plan - Chicken", PLAN)])
+
+    index.search(db, "7", "chicken")
+    index.search(db, "8", "chicken")
+    assert index._indexes.get("7") is None
+    assert index._indexes.get("8") is not None
+    MealPlanSearchIndex._instance = None